@@ -90,12 +90,11 @@ def convert_yaml_octet_string_to_bytes(s: str) -> bytes:
     # javascript codegen behavior. Behavior of javascript is:
     #   * Octet string character >= u+0200 errors out.
     #   * Any character greater than 0xFF has the upper bytes chopped off.
-    as_bytes = [ord(c) for c in s]
+    as_bytes = list(map(ord, s))
 
-    if any([value > 0x200 for value in as_bytes]):
+    if max(as_bytes, default=0) > 0x200:
         raise ValueError('Unsupported char in octet string %r' % as_bytes)
-    accumulated_hex = ''.join([f"{(v & 0xFF):02x}" for v in as_bytes])
-    return binascii.unhexlify(accumulated_hex)
+    return bytes(v & 0xFF for v in as_bytes)
 
 
 def try_add_yaml_support_for_scientific_notation_without_dot(loader):
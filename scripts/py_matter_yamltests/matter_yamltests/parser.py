@@ -13,25 +13,75 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
-import copy
+import contextlib
+import functools
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import weakref
 from dataclasses import dataclass, field
 from enum import Enum, auto
+from types import MappingProxyType
 
 import yaml
 
+try:
+    # The libyaml backed loader is an order of magnitude faster than the pure Python one, but it
+    # is only available when PyYAML has been built against libyaml (e.g. libyaml-dev).
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 from . import fixes
 from .constraints import get_constraints, is_typed_constraint
 from .definitions import SpecDefinitions
 from .pics_checker import PICSChecker
 
-_TESTS_SECTION = [
+
+# Keys whose values are names that are repeated all over the tests and are used as lookup keys.
+# saveAs names become keys of the config variable storage, like the config section keys.
+_INTERNED_VALUES_KEYS = frozenset({
+    'cluster',
+    'command',
+    'attribute',
+    'wait',
+    'saveAs',
+})
+
+
+class _TestFileLoader(SafeLoader):
+    '''The loader used for YAML test files.
+
+    Resolvers are registered on the class, so the fixes are applied to a dedicated subclass, once,
+    instead of accumulating on the shared PyYAML loader every time a file is loaded.
+    '''
+
+    def construct_mapping(self, node, deep=False):
+        # The same keys and cluster/command/attribute names appear in every test step. Interning
+        # them shares a single string object per name and makes dict lookups compare by identity.
+        # Other values, such as labels or octet strings, are mostly unique and are left as is.
+        interned_mapping = {}
+        for key, value in super().construct_mapping(node, deep).items():
+            if type(key) is str:
+                key = sys.intern(key)
+                if key in _INTERNED_VALUES_KEYS and type(value) is str:
+                    value = sys.intern(value)
+            interned_mapping[key] = value
+        return interned_mapping
+
+
+fixes.try_add_yaml_support_for_scientific_notation_without_dot(_TestFileLoader)
+
+_TESTS_SECTION = frozenset({
     'name',
     'config',
     'tests',
     'PICS',
-]
+})
 
-_TEST_SECTION = [
+_TEST_SECTION = frozenset({
     'label',
     'cluster',
     'command',
@@ -52,14 +102,14 @@ _TEST_SECTION = [
     'timedInteractionTimeoutMs',
     'busyWaitMs',
     'wait',
-]
+})
 
-_TEST_ARGUMENTS_SECTION = [
+_TEST_ARGUMENTS_SECTION = frozenset({
     'values',
     'value',
-]
+})
 
-_TEST_RESPONSE_SECTION = [
+_TEST_RESPONSE_SECTION = frozenset({
     'value',
     'values',
     'error',
@@ -68,20 +118,55 @@ _TEST_RESPONSE_SECTION = [
     'type',
     'hasMasksSet',
     'contains',
-    'saveAs'
-]
-
-_ATTRIBUTE_COMMANDS = [
+    'saveAs',
+})
+
+# Valid keys for the sections of a test step.
+_TEST_SCHEMA = {
+    'arguments': _TEST_ARGUMENTS_SECTION,
+    'response': _TEST_RESPONSE_SECTION,
+}
+
+# Types of the containers found in parsed YAML documents.
+_CONTAINER_TYPES = frozenset({dict, list})
+
+# Mapping types that need specific fixes for the values written in YAML.
+_INT64_MAPPINGS = frozenset({
+    'int64u',
+    'int64s',
+    'bitmap64',
+    'epoch_us',
+})
+
+_FLOAT_MAPPINGS = frozenset({
+    'single',
+    'double',
+})
+
+_OCTET_STRING_MAPPINGS = frozenset({
+    'octet_string',
+    'long_octet_string',
+})
+
+# Mapping types for which integer values written in YAML still need to be converted.
+_INTEGER_FIXED_MAPPINGS = _OCTET_STRING_MAPPINGS | {'boolean'}
+
+_FABRIC_INDEX_KEYS = frozenset({
+    'FabricIndex',
+    'fabricIndex',
+})
+
+_ATTRIBUTE_COMMANDS = frozenset({
     'readAttribute',
     'writeAttribute',
     'subscribeAttribute',
     'waitForReport',
-]
+})
 
-_EVENT_COMMANDS = [
+_EVENT_COMMANDS = frozenset({
     'readEvent',
     'subscribeEvent',
-]
+})
 
 
 class PostProcessCheckStatus(Enum):
@@ -108,10 +193,23 @@ class PostProcessCheck:
     it was successful or not.
     '''
 
-    def __init__(self, state: PostProcessCheckStatus, category: PostProcessCheckType, message: str):
+    __slots__ = ('state', 'category', '_message', '_message_args')
+
+    def __init__(self, state: PostProcessCheckStatus, category: PostProcessCheckType, message: str, message_args: dict = None):
         self.state = state
         self.category = category
-        self.message = message
+        self._message = message
+        self._message_args = message_args
+
+    @property
+    def message(self) -> str:
+        # Most of the time only the state of the checks is looked at, so the message is only
+        # formatted the first time it is read, from the message arguments as they are at that
+        # time.
+        if self._message_args is not None:
+            self._message = self._message.format(**self._message_args)
+            self._message_args = None
+        return self._message
 
     def is_success(self) -> bool:
         return self.state == PostProcessCheckStatus.SUCCESS
@@ -129,27 +227,37 @@ class PostProcessResponseResult:
     There are multiple operations that occur when post processing a response. This contains all the
     results for each operation performed. Note that the number and types of steps performed is
     dependant on test step itself.
+
+    When message_args is given to success(), warning() or error(), the message is a format string
+    that is only formatted with those arguments the first time the entry message is read. The
+    arguments are kept by reference: a received value that the runner modifies before reading the
+    message shows up modified in the message.
     '''
 
+    __slots__ = ('entries', 'successes', 'warnings', 'errors')
+
     def __init__(self):
         self.entries = []
         self.successes = 0
         self.warnings = 0
         self.errors = 0
 
-    def success(self, category: PostProcessCheckType, message: str):
+    def success(self, category: PostProcessCheckType, message: str, message_args: dict = None):
         '''Adds a success entry that occured when post processing response to results.'''
-        self._insert(PostProcessCheckStatus.SUCCESS, category, message)
+        self._insert(PostProcessCheckStatus.SUCCESS,
+                     category, message, message_args)
         self.successes += 1
 
-    def warning(self, category: PostProcessCheckType, message: str):
+    def warning(self, category: PostProcessCheckType, message: str, message_args: dict = None):
         '''Adds a warning entry that occured when post processing response to results.'''
-        self._insert(PostProcessCheckStatus.WARNING, category, message)
+        self._insert(PostProcessCheckStatus.WARNING,
+                     category, message, message_args)
         self.warnings += 1
 
-    def error(self, category: PostProcessCheckType, message: str):
+    def error(self, category: PostProcessCheckType, message: str, message_args: dict = None):
         '''Adds an error entry that occured when post processing response to results.'''
-        self._insert(PostProcessCheckStatus.ERROR, category, message)
+        self._insert(PostProcessCheckStatus.ERROR,
+                     category, message, message_args)
         self.errors += 1
 
     def is_success(self):
@@ -160,18 +268,34 @@ class PostProcessResponseResult:
     def is_failure(self):
         return self.errors != 0
 
-    def _insert(self, state: PostProcessCheckStatus, category: PostProcessCheckType, message: str):
-        log = PostProcessCheck(state, category, message)
+    def _insert(self, state: PostProcessCheckStatus, category: PostProcessCheckType, message: str, message_args: dict):
+        log = PostProcessCheck(state, category, message, message_args)
         self.entries.append(log)
 
 
-def _check_valid_keys(section, valid_keys_dict):
-    if section:
+def _check_valid_keys(section, valid_keys: frozenset):
+    if section and not valid_keys.issuperset(section):
         for key in section:
-            if key not in valid_keys_dict:
+            if key not in valid_keys:
                 raise KeyError(f'Unknown key: {key}')
 
 
+def _check_valid_test_keys(test: dict):
+    '''Validates the keys of a test step and of its sections against _TEST_SCHEMA.'''
+    _check_valid_keys(test, _TEST_SECTION)
+    for section_name, valid_keys in _TEST_SCHEMA.items():
+        _check_valid_keys(test.get(section_name), valid_keys)
+
+
+def _is_test_enabled(test: dict):
+    '''Returns whether a test step from the YAML document should be parsed.
+
+    Disabled tests are not parsed in order to allow the test to be added to the test suite even
+    if the feature is not implemented yet.
+    '''
+    return not test.get('disabled')
+
+
 def _value_or_none(data, key):
     return data[key] if key in data else None
 
@@ -180,6 +304,161 @@ def _value_or_config(data, key, config):
     return data[key] if key in data else config.get(key)
 
 
+def _fast_clone(value):
+    '''Clone a value parsed from YAML.
+
+    Parsed YAML only contains dicts, lists and immutable scalars, so unlike copy.deepcopy there
+    is no need for a memo dict or for the generic per-type dispatch.
+    '''
+    value_type = type(value)
+    if value_type is dict:
+        return {key: _fast_clone(item) for key, item in value.items()}
+    if value_type is list:
+        # Lists of scalars, e.g. lists of integers, are copied in C instead of one call per entry.
+        holds_containers = not _CONTAINER_TYPES.isdisjoint(map(type, value))
+        return [_fast_clone(item) for item in value] if holds_containers else list(value)
+    return value
+
+
+class _ResponseValueChecks:
+    '''The post processing checks to perform for a single expected response value.
+
+    Those only depend on the keys of the expected value and on the response mapping, so they are
+    computed once when the test step is parsed instead of for every post processed response.
+    '''
+
+    __slots__ = ('name', 'type_name', 'has_value', 'has_constraints',
+                 'constraints', 'constraints_with_placeholders', 'has_save_as')
+
+    def __init__(self, name: str, type_name: str, has_value: bool, constraints_with_placeholders: dict, has_save_as: bool):
+        self.name = name
+        self.type_name = type_name
+        self.has_value = has_value
+        self.has_constraints = constraints_with_placeholders is not None
+        self.constraints = get_constraints(
+            constraints_with_placeholders) if self.has_constraints else None
+        self.constraints_with_placeholders = constraints_with_placeholders
+        self.has_save_as = has_save_as
+
+
+# Mappings only depend on the definitions they have been computed from, so they are shared by all
+# the test steps using those definitions. Entries are dropped once the definitions are released.
+_mappings_cache = weakref.WeakKeyDictionary()
+
+
+class _FieldsMapping(dict):
+    '''The type mapping of each field of a struct or of a command.
+
+    Instances are shared between test steps, so they are read only. The field names are also
+    indexed by their lowercased form, so a misspelled key can be reported with the name it most
+    likely refers to.
+    '''
+    __slots__ = ('lowercased_keys',)
+
+    def __init__(self, fields):
+        super().__init__(fields)
+        self.lowercased_keys = MappingProxyType(
+            {key.lower(): key for key in self})
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(
+            f"'{type(self).__name__}' object does not support modifications")
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    __ior__ = _read_only
+    clear = _read_only
+    pop = _read_only
+    popitem = _read_only
+    setdefault = _read_only
+    update = _read_only
+
+
+def _as_mapping(definitions: SpecDefinitions, cluster_name: str, target_name: str):
+    '''Returns the mapping of the target type, either as a type name or as a mapping per field.
+
+    The result is cached and shared between test steps, so composite mappings must not be modified.
+    '''
+    cache = _mappings_cache.get(definitions)
+    if cache is None:
+        cache = _mappings_cache[definitions] = {}
+
+    key = (cluster_name, target_name)
+    if key in cache:
+        return cache[key]
+
+    mapping = target_name
+    element = definitions.get_type_by_name(cluster_name, target_name)
+    if hasattr(element, 'base_type'):
+        mapping = element.base_type.lower()
+    elif hasattr(element, 'fields'):
+        mapping = _FieldsMapping({f.name: _as_mapping(
+            definitions, cluster_name, f.data_type.name) for f in element.fields})
+    elif target_name:
+        mapping = target_name.lower()
+
+    cache[key] = mapping
+    return mapping
+
+
+# Iterates over the (key, item) pairs of the containers found in parsed YAML values, so both
+# kinds of containers can be addressed through container[key].
+_CONTAINER_ITEMS = {list: enumerate, dict: dict.items}
+
+
+def _may_need_substitution(value: str, config: dict):
+    '''Returns whether substituting config variables in a string may change it.
+
+    Only the tokens naming a variable of the config are replaced, and every variable, including
+    the saveAs ones, is declared in the config before the test steps that use it. Other strings
+    are only changed by the whitespace normalization of the tokenizer.
+    '''
+    tokens = value.split()
+    return any(token in config for token in tokens) or ' '.join(tokens) != value
+
+
+def _get_placeholder_paths(container: dict, config: dict):
+    '''Returns the path of each string of the values and constraints of a container.
+
+    Paths are relative to container['values']. Config variables can only be referenced from
+    those strings, and strings that no substitution would change are left out.
+    '''
+    paths = []
+    if not container:
+        return paths
+
+    for idx, item in enumerate(container['values']):
+        pending = []
+        if 'value' in item:
+            pending.append(((idx, 'value'), item['value']))
+        if 'constraints' in item:
+            pending.extend(((idx, 'constraints', constraint), constraint_value)
+                           for constraint, constraint_value in item['constraints'].items())
+
+        while pending:
+            path, value = pending.pop()
+            value_type = type(value)
+            if value_type is str:
+                if _may_need_substitution(value, config):
+                    paths.append(path)
+            elif value_type in _CONTAINER_ITEMS:
+                pending.extend((path + (key,), entry)
+                               for key, entry in _CONTAINER_ITEMS[value_type](value))
+
+    return paths
+
+
+# Expressions are evaluated without access to builtins since they only combine config variables
+# with literals and operators. This is not a sandbox.
+_EXPRESSION_GLOBALS = {'__builtins__': {}}
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_expression(expression: str):
+    '''Compiles an expression once, as the same expressions are used by many test steps.'''
+    return compile(expression, '<expression>', 'eval')
+
+
 class _TestStepWithPlaceholders:
     '''A single YAML test parsed, as is, from YAML.
 
@@ -188,16 +467,47 @@ class _TestStepWithPlaceholders:
     processed.
     '''
 
+    __slots__ = (
+        'is_enabled',
+        '_parsing_config_variable_storage',
+        'label',
+        'optional',
+        'node_id',
+        'group_id',
+        'cluster',
+        'command',
+        'attribute',
+        'endpoint',
+        'is_pics_enabled',
+        'identity',
+        'fabric_filtered',
+        'min_interval',
+        'max_interval',
+        'timed_interaction_timeout_ms',
+        'busy_wait_ms',
+        'wait_for',
+        'is_attribute',
+        'is_event',
+        'arguments_with_placeholders',
+        'response_with_placeholders',
+        'argument_mapping',
+        'response_mapping',
+        'response_mapping_name',
+        'arguments_placeholder_paths',
+        'response_placeholder_paths',
+        'response_values_checks',
+        'has_response_values_checks',
+        'has_response_cluster_error',
+    )
+
     def __init__(self, test: dict, config: dict, definitions: SpecDefinitions, pics_checker: PICSChecker):
-        # Disabled tests are not parsed in order to allow the test to be added to the test
-        # suite even if the feature is not implemented yet.
-        self.is_enabled = not ('disabled' in test and test['disabled'])
+        self.is_enabled = _is_test_enabled(test)
         if not self.is_enabled:
             return
 
         self._parsing_config_variable_storage = config
 
-        _check_valid_keys(test, _TEST_SECTION)
+        _check_valid_test_keys(test)
 
         self.label = _value_or_none(test, 'label')
         self.optional = _value_or_none(test, 'optional')
@@ -224,11 +534,6 @@ class _TestStepWithPlaceholders:
         self.arguments_with_placeholders = _value_or_none(test, 'arguments')
         self.response_with_placeholders = _value_or_none(test, 'response')
 
-        _check_valid_keys(self.arguments_with_placeholders,
-                          _TEST_ARGUMENTS_SECTION)
-        _check_valid_keys(self.response_with_placeholders,
-                          _TEST_RESPONSE_SECTION)
-
         self._convert_single_value_to_values(self.arguments_with_placeholders)
         self._convert_single_value_to_values(self.response_with_placeholders)
 
@@ -240,8 +545,8 @@ class _TestStepWithPlaceholders:
             attribute = definitions.get_attribute_by_name(
                 self.cluster, self.attribute)
             if attribute:
-                attribute_mapping = self._as_mapping(definitions, self.cluster,
-                                                     attribute.definition.data_type.name)
+                attribute_mapping = _as_mapping(definitions, self.cluster,
+                                                attribute.definition.data_type.name)
                 argument_mapping = attribute_mapping
                 response_mapping = attribute_mapping
                 response_mapping_name = attribute.definition.data_type.name
@@ -249,9 +554,9 @@ class _TestStepWithPlaceholders:
             command = definitions.get_command_by_name(
                 self.cluster, self.command)
             if command:
-                argument_mapping = self._as_mapping(
+                argument_mapping = _as_mapping(
                     definitions, self.cluster, command.input_param)
-                response_mapping = self._as_mapping(
+                response_mapping = _as_mapping(
                     definitions, self.cluster, command.output_param)
                 response_mapping_name = command.output_param
 
@@ -261,16 +566,59 @@ class _TestStepWithPlaceholders:
         self.update_arguments(self.arguments_with_placeholders)
         self.update_response(self.response_with_placeholders)
 
-        # This performs a very basic sanity parse time check of constraints. This parsing happens
-        # again inside post processing response since at that time we will have required variables
-        # to substitute in. This parsing check here has value since some test can take a really
-        # long time to run so knowing earlier on that the test step would have failed at parsing
-        # time before the test step run occurs save developer time that building yaml tests.
+        # saveAs variables are declared by update_response, but only for responses with a
+        # definition. They are declared for every response so that the placeholder paths below
+        # also cover the strings referring to variables saved by pseudo cluster steps.
         if self.response_with_placeholders:
             for value in self.response_with_placeholders['values']:
-                if 'constraints' not in value:
-                    continue
-                get_constraints(value['constraints'])
+                save_as = value.get('saveAs')
+                if type(save_as) is str:
+                    config.setdefault(save_as, None)
+
+        # The strings that may refer to config variables are located once, so each run of the
+        # test step only visits those instead of walking all the values again.
+        self.arguments_placeholder_paths = _get_placeholder_paths(
+            self.arguments_with_placeholders, config)
+        self.response_placeholder_paths = _get_placeholder_paths(
+            self.response_with_placeholders, config)
+
+        # This performs a very basic sanity parse time check of constraints. This parsing check
+        # has value since some test can take a really long time to run so knowing earlier on that
+        # the test step would have failed at parsing time before the test step run occurs save
+        # developer time that building yaml tests.
+        self.response_values_checks = None
+        if self.response_with_placeholders:
+            self.response_values_checks = [self._get_response_value_checks(
+                value) for value in self.response_with_placeholders['values']]
+
+        # Flags used to skip whole post processing steps that have nothing to check.
+        self.has_response_values_checks = self.response_values_checks is not None and any(
+            self.response_values_checks)
+        self.has_response_cluster_error = bool(
+            self.response_with_placeholders and self.response_with_placeholders.get('clusterError'))
+
+    def _get_response_value_checks(self, value):
+        has_value = 'value' in value
+        has_constraints = 'constraints' in value
+        has_save_as = 'saveAs' in value
+        if not has_value and not has_constraints and not has_save_as:
+            return None
+
+        name = 'value' if self.is_attribute else value.get('name')
+
+        type_name = None
+        if has_constraints:
+            if self.is_attribute:
+                type_name = self.response_mapping_name
+            elif self.response_mapping:
+                type_name = self.response_mapping.get(name)
+            else:
+                # We don't have a mapping for this type. This happens for pseudo clusters.
+                # If there is a constraint check for the type it is likely an incorrect
+                # constraint check by the test writter.
+                type_name = None
+
+        return _ResponseValueChecks(name, type_name, has_value, value.get('constraints'), has_save_as)
 
     def _convert_single_value_to_values(self, container):
         if container is None or 'values' in container:
@@ -296,19 +644,6 @@ class _TestStepWithPlaceholders:
 
         container['values'] = [value]
 
-    def _as_mapping(self, definitions, cluster_name, target_name):
-        element = definitions.get_type_by_name(cluster_name, target_name)
-
-        if hasattr(element, 'base_type'):
-            target_name = element.base_type.lower()
-        elif hasattr(element, 'fields'):
-            target_name = {f.name: self._as_mapping(
-                definitions, cluster_name, f.data_type.name) for f in element.fields}
-        elif target_name:
-            target_name = target_name.lower()
-
-        return target_name
-
     def update_arguments(self, arguments_with_placeholders):
         self._update_with_definition(
             arguments_with_placeholders, self.argument_mapping)
@@ -321,21 +656,26 @@ class _TestStepWithPlaceholders:
         if not container or not mapping_type:
             return
 
-        for value in list(container['values']):
-            for key, item_value in list(value.items()):
-                if self.is_attribute:
-                    mapping = mapping_type
-                else:
-                    target_key = value['name']
-                    if mapping_type.get(target_key) is None:
-                        for candidate_key in mapping_type:
-                            if candidate_key.lower() == target_key.lower():
-                                raise KeyError(
-                                    f'"{self.label}": Unknown key: "{target_key}". Did you mean "{candidate_key}" ?')
+        for value in container['values']:
+            if not value:
+                # Responses that only expect an error have a single empty value.
+                continue
+
+            if self.is_attribute:
+                mapping = mapping_type
+            else:
+                target_key = value['name']
+                mapping = mapping_type.get(target_key)
+                if mapping is None:
+                    candidate_key = mapping_type.lowercased_keys.get(
+                        target_key.lower())
+                    if candidate_key is not None:
                         raise KeyError(
-                            f'"{self.label}": Unknown key: "{target_key}". Candidates are: "{[ key for key in mapping_type]}".')
-                    mapping = mapping_type[target_key]
+                            f'"{self.label}": Unknown key: "{target_key}". Did you mean "{candidate_key}" ?')
+                    raise KeyError(
+                        f'"{self.label}": Unknown key: "{target_key}". Candidates are: "{[ key for key in mapping_type]}".')
 
+            for key, item_value in value.items():
                 if key == 'value':
                     value[key] = self._update_value_with_definition(
                         item_value, mapping)
@@ -358,35 +698,57 @@ class _TestStepWithPlaceholders:
 
         if type(value) is dict:
             rv = {}
-            for key in value:
+            for key, item_value in value.items():
                 # FabricIndex is a special case where the framework requires it to be passed even
                 # if it is not part of the requested arguments per spec and not part of the XML
                 # definition.
-                if key == 'FabricIndex' or key == 'fabricIndex':
-                    rv[key] = value[key]  # int64u
+                if key in _FABRIC_INDEX_KEYS:
+                    rv[key] = item_value  # int64u
                 else:
-                    mapping = mapping_type[key]
                     rv[key] = self._update_value_with_definition(
-                        value[key], mapping)
+                        item_value, mapping_type[key])
             return rv
         if type(value) is list:
+            # Lists of integers are common and integers never need a fix unless the mapping is a
+            # boolean or an octet string. Those lists are checked and copied in C instead of
+            # visiting every entry.
+            fixes_integers = type(
+                mapping_type) is not str or mapping_type in _INTEGER_FIXED_MAPPINGS
+            if not fixes_integers and set(map(type, value)) <= {int}:
+                return list(value)
             return [self._update_value_with_definition(entry, mapping_type) for entry in value]
+        if value is None:
+            return value
+
+        value_type = type(value)
         # TODO currently unsure if the check of `value not in config` is sufficant. For
         # example let's say value = 'foo + 1' and map type is 'int64u', we would arguably do
         # the wrong thing below.
-        if value is not None and value not in self._parsing_config_variable_storage:
-            if mapping_type == 'int64u' or mapping_type == 'int64s' or mapping_type == 'bitmap64' or mapping_type == 'epoch_us':
+        if value_type is str and value in self._parsing_config_variable_storage:
+            return value
+
+        # The fixes below only ever change values that are not already of the native type for
+        # the mapping, so those are returned as is. Composite mappings do not name a type, they
+        # are only used by typed constraints of command fields.
+        if type(mapping_type) is not str:
+            mapping_type = None
+
+        if mapping_type in _INT64_MAPPINGS:
+            if value_type is float or value_type is str:
                 value = fixes.try_apply_float_to_integer_fix(value)
                 value = fixes.try_apply_yaml_cpp_longlong_limitation_fix(value)
                 value = fixes.try_apply_yaml_unrepresentable_integer_for_javascript_fixes(
                     value)
-            elif mapping_type == 'single' or mapping_type == 'double':
+        elif mapping_type in _FLOAT_MAPPINGS:
+            if value_type is str:
                 value = fixes.try_apply_yaml_float_written_as_strings(value)
-            elif isinstance(value, float) and mapping_type != 'single' and mapping_type != 'double':
-                value = fixes.try_apply_float_to_integer_fix(value)
-            elif mapping_type == 'octet_string' or mapping_type == 'long_octet_string':
+        elif value_type is float:
+            value = fixes.try_apply_float_to_integer_fix(value)
+        elif mapping_type in _OCTET_STRING_MAPPINGS:
+            if value_type is not bytes:
                 value = fixes.convert_yaml_octet_string_to_bytes(value)
-            elif mapping_type == 'boolean':
+        elif mapping_type == 'boolean':
+            if value_type is not bool:
                 value = bool(value)
 
         return value
@@ -401,18 +763,32 @@ class TestStep:
     and saves any variables that might be required but test step that have yet to be executed.
     '''
 
+    __slots__ = (
+        '_test',
+        '_runtime_config_variable_storage',
+        'arguments',
+        'response',
+    )
+
     def __init__(self, test: _TestStepWithPlaceholders, runtime_config_variable_storage: dict):
         self._test = test
         self._runtime_config_variable_storage = runtime_config_variable_storage
-        self.arguments = copy.deepcopy(test.arguments_with_placeholders)
-        self.response = copy.deepcopy(test.response_with_placeholders)
+        self.arguments = _fast_clone(test.arguments_with_placeholders)
+        self.response = _fast_clone(test.response_with_placeholders)
         if test.is_pics_enabled:
-            self._update_placeholder_values(self.arguments)
-            self._update_placeholder_values(self.response)
-            self._test.node_id = self._config_variable_substitution(
-                self._test.node_id)
-            test.update_arguments(self.arguments)
-            test.update_response(self.response)
+            # Values are already updated with their definition at parse time, so only the
+            # containers with substituted values need to be updated again.
+            if test.arguments_placeholder_paths:
+                self._update_placeholder_values(
+                    self.arguments, test.arguments_placeholder_paths)
+                test.update_arguments(self.arguments)
+            if test.response_placeholder_paths:
+                self._update_placeholder_values(
+                    self.response, test.response_placeholder_paths)
+                test.update_response(self.response)
+            if type(self._test.node_id) is str:
+                self._test.node_id = self._config_variable_substitution(
+                    self._test.node_id)
 
     @property
     def is_enabled(self):
@@ -501,11 +877,10 @@ class TestStep:
             return result
 
         self._response_error_validation(response, result)
-        if self.response:
+        if self._test.has_response_cluster_error:
             self._response_cluster_error_validation(response, result)
-            self._response_values_validation(response, result)
-            self._response_constraints_validation(response, result)
-            self._maybe_save_as(response, result)
+        if self._test.has_response_values_checks:
+            self._response_values_post_processing(response, result)
 
         return result
 
@@ -527,33 +902,34 @@ class TestStep:
             expected_wait_type = self.command
             received_wait_type = response.get('command')
 
-        expected_values = [
+        expected_values = (
             self.wait_for,
             self.endpoint,
             # TODO The name in tests does not always use spaces
             self.cluster.replace(' ', ''),
             expected_wait_type
-        ]
+        )
 
-        received_values = [
+        received_values = (
             response.get('wait_for'),
             response.get('endpoint'),
             response.get('cluster'),
             received_wait_type
-        ]
-
-        success = True
-        for expected_value in expected_values:
-            received_value = received_values.pop(0)
+        )
+
+        if expected_values == received_values:
+            result.success(check_type, error_success, {
+                'wait_for': self.wait_for,
+                'cluster': self.cluster,
+                'wait_type': expected_wait_type,
+                'endpoint': self.endpoint,
+            })
+            return
 
+        for expected_value, received_value in zip(expected_values, received_values):
             if expected_value != received_value:
-                result.error(check_type, error_failure.format(
-                    expected=expected_value, received=received_value))
-                success = False
-
-        if success:
-            result.success(check_type, error_success.format(
-                wait_for=self.wait_for, cluster=self.cluster, wait_type=expected_wait_type, endpoint=self.endpoint))
+                result.error(check_type, error_failure, {
+                             'expected': expected_value, 'received': received_value})
 
     def _skip_post_processing(self, response: dict, result) -> bool:
         '''Should we skip perform post processing.
@@ -589,17 +965,17 @@ class TestStep:
         received_error = response.get('error')
 
         if expected_error and received_error and expected_error == received_error:
-            result.success(check_type, error_success.format(
-                error=expected_error))
+            result.success(check_type, error_success,
+                           {'error': expected_error})
         elif expected_error and received_error:
-            result.error(check_type, error_wrong_error.format(
-                error=expected_error, value=received_error))
+            result.error(check_type, error_wrong_error, {
+                         'error': expected_error, 'value': received_error})
         elif expected_error and not received_error:
-            result.error(check_type, error_unexpected_success.format(
-                error=expected_error))
+            result.error(check_type, error_unexpected_success,
+                         {'error': expected_error})
         elif not expected_error and received_error:
-            result.error(check_type, error_unexpected_error.format(
-                error=received_error))
+            result.error(check_type, error_unexpected_error,
+                         {'error': received_error})
         elif not expected_error and not received_error:
             result.success(check_type, error_success_no_error)
         else:
@@ -617,50 +993,85 @@ class TestStep:
 
         if expected_error:
             if received_error and expected_error == received_error:
-                result.success(check_type, error_success.format(
-                    error=expected_error))
+                result.success(check_type, error_success,
+                               {'error': expected_error})
             elif received_error:
-                result.error(check_type, error_wrong_error.format(
-                    error=expected_error, value=received_error))
+                result.error(check_type, error_wrong_error, {
+                             'error': expected_error, 'value': received_error})
             else:
-                result.error(check_type, error_unexpected_success.format(
-                    error=expected_error))
+                result.error(check_type, error_unexpected_success,
+                             {'error': expected_error})
         else:
             # Nothing is logged here to not be redundant with the generic error checking code.
             pass
 
-    def _response_values_validation(self, response, result):
+    def _response_values_post_processing(self, response, result):
+        '''Validates the values and constraints of the response and saves the requested values.
+
+        Every check of an expected value is performed in a single pass over the expected values so
+        the corresponding received value is only looked up once. The checks to perform for each of
+        the values have been computed when the test step was parsed.
+        '''
+        top_value = response.get('value')
+        for value, checks in zip(self.response['values'], self._test.response_values_checks):
+            if checks is None:
+                continue
+
+            expected_name = checks.name
+            received_value = top_value
+            name_exists = True
+            if not self.is_attribute:
+                name_exists = isinstance(
+                    top_value, dict) and expected_name in top_value
+                received_value = top_value.get(
+                    expected_name) if name_exists else None
+
+            if checks.has_value:
+                self._response_values_validation(
+                    value, expected_name, received_value, name_exists, result)
+
+            if checks.has_constraints:
+                self._response_constraints_validation(
+                    value, checks, received_value, result)
+
+            if checks.has_save_as:
+                self._maybe_save_as(
+                    value, expected_name, received_value, name_exists, result)
+
+    def _response_values_validation(self, value, expected_name, received_value, name_exists, result):
         check_type = PostProcessCheckType.RESPONSE_VALIDATION
         error_success = 'The test expectation "{name} == {value}" is true'
         error_failure = 'The test expectation "{name} == {value}" is false'
         error_name_does_not_exist = 'The test expects a value named "{name}" but it does not exists in the response."'
 
-        for value in self.response['values']:
-            if 'value' not in value:
-                continue
+        if not name_exists:
+            result.error(check_type, error_name_does_not_exist,
+                         {'name': expected_name})
+            return
 
-            expected_name = 'value'
-            received_value = response.get('value')
-            if not self.is_attribute:
-                expected_name = value.get('name')
-                if received_value is None or expected_name not in received_value:
-                    result.error(check_type, error_name_does_not_exist.format(
-                        name=expected_name))
-                    continue
-
-                received_value = received_value.get(
-                    expected_name) if received_value else None
-
-            expected_value = value.get('value')
-            if self._response_value_validation(expected_value, received_value):
-                result.success(check_type, error_success.format(
-                    name=expected_name, value=expected_value))
-            else:
-                result.error(check_type, error_failure.format(
-                    name=expected_name, value=expected_value))
+        expected_value = value.get('value')
+        if self._response_value_validation(expected_value, received_value):
+            result.success(check_type, error_success, {
+                           'name': expected_name, 'value': expected_value})
+        else:
+            result.error(check_type, error_failure, {
+                         'name': expected_name, 'value': expected_value})
 
     def _response_value_validation(self, expected_value, received_value):
+        if not isinstance(expected_value, (list, dict)):
+            return expected_value == received_value
+
+        # The received value is most of the time equal to the expected one, which the builtin
+        # container comparison checks in C. Walking the containers is only needed when it is not,
+        # since received structs are allowed to carry more fields than the expected ones.
+        if expected_value == received_value:
+            return True
+
         if isinstance(expected_value, list):
+            if type(received_value) is list and not any(isinstance(item, (list, dict)) for item in expected_value):
+                # Lists of scalars only match when they are equal.
+                return False
+
             if len(expected_value) != len(received_value):
                 return False
 
@@ -669,136 +1080,109 @@ class TestStep:
                 if not self._response_value_validation(expected_item, received_item):
                     return False
             return True
-        elif isinstance(expected_value, dict):
-            for key, expected_item in expected_value.items():
-                received_item = received_value.get(key)
-                if not self._response_value_validation(expected_item, received_item):
-                    return False
-            return True
-        else:
-            return expected_value == received_value
 
-    def _response_constraints_validation(self, response, result):
+        for key, expected_item in expected_value.items():
+            received_item = received_value.get(key)
+            if not self._response_value_validation(expected_item, received_item):
+                return False
+        return True
+
+    def _response_constraints_validation(self, value, checks, received_value, result):
         check_type = PostProcessCheckType.CONSTRAINT_VALIDATION
         error_success = 'Constraints check passed'
         error_failure = 'Constraints check failed'
 
-        response_type_name = self._test.response_mapping_name
-        for value in self.response['values']:
-            if 'constraints' not in value:
-                continue
-
-            received_value = response.get('value')
-            if not self.is_attribute:
-                expected_name = value.get('name')
-                if received_value is None or expected_name not in received_value:
-                    received_value = None
-                else:
-                    received_value = received_value.get(
-                        expected_name) if received_value else None
-
-                if self._test.response_mapping:
-                    response_type_name = self._test.response_mapping.get(
-                        expected_name)
-                else:
-                    # We don't have a mapping for this type. This happens for pseudo clusters.
-                    # If there is a constraint check for the type it is likely an incorrect
-                    # constraint check by the test writter.
-                    response_type_name = None
-
+        # The constraints have already been parsed unless a variable substitution changed them.
+        constraints = checks.constraints
+        if value['constraints'] != checks.constraints_with_placeholders:
             constraints = get_constraints(value['constraints'])
 
-            if all([constraint.is_met(received_value, response_type_name) for constraint in constraints]):
-                result.success(check_type, error_success)
-            else:
-                # TODO would be helpful to be more verbose here
-                result.error(check_type, error_failure)
+        response_type_name = checks.type_name
+        if all([constraint.is_met(received_value, response_type_name) for constraint in constraints]):
+            result.success(check_type, error_success)
+        else:
+            # TODO would be helpful to be more verbose here
+            result.error(check_type, error_failure)
 
-    def _maybe_save_as(self, response, result):
+    def _maybe_save_as(self, value, expected_name, received_value, name_exists, result):
         check_type = PostProcessCheckType.SAVE_AS_VARIABLE
         error_success = 'The test save the value "{value}" as {name}.'
         error_name_does_not_exist = 'The test expects a value named "{name}" but it does not exists in the response."'
 
-        for value in self.response['values']:
-            if 'saveAs' not in value:
-                continue
-
-            received_value = response.get('value')
-            if not self.is_attribute:
-                expected_name = value.get('name')
-                if received_value is None or expected_name not in received_value:
-                    result.error(check_type, error_name_does_not_exist.format(
-                        name=expected_name))
-                    continue
-
-                received_value = received_value.get(
-                    expected_name) if received_value else None
-
-            save_as = value.get('saveAs')
-            self._runtime_config_variable_storage[save_as] = received_value
-            result.success(check_type, error_success.format(
-                value=received_value, name=save_as))
-
-    def _update_placeholder_values(self, container):
-        if not container:
+        if not name_exists:
+            result.error(check_type, error_name_does_not_exist,
+                         {'name': expected_name})
             return
 
-        values = container['values']
-
-        for idx, item in enumerate(values):
-            if 'value' in item:
-                values[idx]['value'] = self._config_variable_substitution(
-                    item['value'])
-
-            if 'constraints' in item:
-                for constraint, constraint_value in item['constraints'].items():
-                    values[idx]['constraints'][constraint] = self._config_variable_substitution(
-                        constraint_value)
+        save_as = value.get('saveAs')
+        self._runtime_config_variable_storage[save_as] = received_value
+        result.success(check_type, error_success, {
+                       'value': received_value, 'name': save_as})
 
-        container['values'] = values
-
-    def _config_variable_substitution(self, value):
-        if type(value) is list:
-            return [self._config_variable_substitution(entry) for entry in value]
-        elif type(value) is dict:
-            mapped_value = {}
-            for key in value:
-                mapped_value[key] = self._config_variable_substitution(
-                    value[key])
-            return mapped_value
-        elif type(value) is str:
-            # For most tests, a single config variable is used and it can be replaced as in.
-            # But some other tests were relying on the fact that the expression was put 'as if' in
-            # the generated code and was resolved before being sent over the wire. For such
-            # expressions (e.g 'myVar + 1') we need to compute it before sending it over the wire.
-            tokens = value.split()
-            if len(tokens) == 0:
-                return value
-
-            substitution_occured = False
-            for idx, token in enumerate(tokens):
-                if token in self._runtime_config_variable_storage:
-                    variable_info = self._runtime_config_variable_storage[token]
-                    if type(variable_info) is dict and 'defaultValue' in variable_info:
-                        variable_info = variable_info['defaultValue']
-                    if variable_info is not None:
-                        tokens[idx] = variable_info
-                        substitution_occured = True
-
-            if len(tokens) == 1:
-                return tokens[0]
-
-            tokens = [str(token) for token in tokens]
-            value = ' '.join(tokens)
-            # TODO we should move away from eval. That will mean that we will need to do extra
-            # parsing, but it would be safer then just blindly running eval.
-            return value if not substitution_occured else eval(value)
-        else:
+    def _update_placeholder_values(self, container, placeholder_paths):
+        values = container['values']
+        for path in placeholder_paths:
+            parent = values
+            for key in path[:-1]:
+                parent = parent[key]
+
+            key = path[-1]
+            parent[key] = self._config_variable_substitution(
+                parent[key])
+
+    def _config_variable_substitution(self, value: str):
+        # For most tests, a single config variable is used and it can be replaced as in.
+        # But some other tests were relying on the fact that the expression was put 'as if' in
+        # the generated code and was resolved before being sent over the wire. For such
+        # expressions (e.g 'myVar + 1') we need to compute it before sending it over the wire.
+        #
+        # A string without whitespace is a single token, so it is either a config variable
+        # or kept as is. Space is the only printable whitespace character.
+        if ' ' not in value and value.isprintable():
+            variable_info = self._runtime_config_variable_storage.get(
+                value)
+            if type(variable_info) is dict and 'defaultValue' in variable_info:
+                variable_info = variable_info['defaultValue']
+            return value if variable_info is None else variable_info
+
+        tokens = value.split()
+        if len(tokens) == 0:
             return value
 
+        substitution_occured = False
+        variables = {}
+        expression = list(tokens)
+        for idx, token in enumerate(tokens):
+            if token in self._runtime_config_variable_storage:
+                variable_info = self._runtime_config_variable_storage[token]
+                if type(variable_info) is dict and 'defaultValue' in variable_info:
+                    variable_info = variable_info['defaultValue']
+                if variable_info is not None:
+                    tokens[idx] = variable_info
+                    substitution_occured = True
+                    # Strings are part of the expression itself, other values are bound
+                    # to a placeholder so the compiled expression can be reused.
+                    if type(variable_info) is str:
+                        expression[idx] = variable_info
+                    else:
+                        placeholder = f'_v{len(variables)}'
+                        variables[placeholder] = variable_info
+                        expression[idx] = placeholder
+
+        if len(tokens) == 1:
+            return tokens[0]
+
+        if not substitution_occured:
+            return ' '.join(tokens)
+
+        # TODO we should move away from eval. That will mean that we will need to do extra
+        # parsing, but it would be safer then just blindly running eval. Hiding the builtins does
+        # not sandbox the expression, which still runs arbitrary code from the test file.
+        return eval(_compile_expression(' '.join(expression)), _EXPRESSION_GLOBALS, variables)
+
 
 class YamlTests:
-    '''Parses YAML tests and becomes an iterator to provide 'TestStep's
+    '''Parses YAML tests and is iterable to provide 'TestStep's
 
     The provided TestStep is expected to be used by a runner/adapter to run the test step and
     provide the response from the device to the TestStep object.
@@ -808,34 +1192,52 @@ class YamlTests:
     multiple runs.
     '''
 
+    __slots__ = (
+        '_parsing_config_variable_storage',
+        '_runtime_config_variable_storage',
+        '_tests',
+        'count',
+    )
+
     def __init__(self, parsing_config_variable_storage: dict, definitions: SpecDefinitions, pics_checker: PICSChecker, tests: dict):
         self._parsing_config_variable_storage = parsing_config_variable_storage
-        enabled_tests = []
-        for test in tests:
-            test_with_placeholders = _TestStepWithPlaceholders(
-                test, self._parsing_config_variable_storage, definitions, pics_checker)
-            if test_with_placeholders.is_enabled:
-                enabled_tests.append(test_with_placeholders)
+        enabled_tests = [_TestStepWithPlaceholders(test, self._parsing_config_variable_storage, definitions, pics_checker)
+                         for test in tests if _is_test_enabled(test)]
         fixes.try_update_yaml_node_id_test_runner_state(
             enabled_tests, self._parsing_config_variable_storage)
 
-        self._runtime_config_variable_storage = copy.deepcopy(
-            parsing_config_variable_storage)
+        # At runtime, variables are only ever replaced as a whole, by saveAs. Copying the
+        # first level of the storage is enough to keep the parsing storage untouched.
+        runtime_config_variable_storage = {}
+        for key, value in parsing_config_variable_storage.items():
+            value_type = type(value)
+            if value_type is dict:
+                value = dict(value)
+            elif value_type is list:
+                value = list(value)
+            runtime_config_variable_storage[key] = value
+
+        self._runtime_config_variable_storage = runtime_config_variable_storage
         self._tests = enabled_tests
-        self._index = 0
         self.count = len(self._tests)
 
     def __iter__(self):
-        return self
+        runtime_config_variable_storage = self._runtime_config_variable_storage
+        for test in self._tests:
+            yield TestStep(test, runtime_config_variable_storage)
+
 
-    def __next__(self) -> TestStep:
-        if self._index < self.count:
-            test = self._tests[self._index]
-            test_step = TestStep(test, self._runtime_config_variable_storage)
-            self._index += 1
-            return test_step
+# Part of the signature of the parsed YAML cache entries. It must be increased whenever the
+# documents produced by the loader change, so entries written by an older parser are ignored.
+_CACHE_VERSION = 1
 
-        raise StopIteration
+# Values of the config variables that a test does not define.
+_DEFAULT_CONFIG = {
+    'nodeId': 0x12345,
+    'endpoint': '',
+    'cluster': '',
+    'timeout': '90',
+}
 
 
 @dataclass
@@ -843,11 +1245,12 @@ class TestParserConfig:
     pics: str = None
     definitions: SpecDefinitions = None
     config_override: dict = field(default_factory=dict)
+    cache_directory: str = None
 
 
 class TestParser:
     def __init__(self, test_file: str, parser_config: TestParserConfig = TestParserConfig()):
-        data = self.__load_yaml(test_file)
+        data = self.__load_yaml(test_file, parser_config.cache_directory)
 
         _check_valid_keys(data, _TESTS_SECTION)
 
@@ -867,25 +1270,65 @@ class TestParser:
 
         # These are a list of "KnownVariables". These are defaults the codegen used to use. This
         # is added for legacy support of tests that expect to uses these "defaults".
-        self.__populate_default_config_if_missing('nodeId', 0x12345)
-        self.__populate_default_config_if_missing('endpoint', '')
-        self.__populate_default_config_if_missing('cluster', '')
-        self.__populate_default_config_if_missing('timeout', '90')
+        for key, value in _DEFAULT_CONFIG.items():
+            self._parsing_config_variable_storage.setdefault(key, value)
 
         pics_checker = PICSChecker(parser_config.pics)
         tests = _value_or_none(data, 'tests')
         self.tests = YamlTests(
             self._parsing_config_variable_storage, parser_config.definitions, pics_checker, tests)
 
-    def __populate_default_config_if_missing(self, key, value):
-        if key not in self._parsing_config_variable_storage:
-            self._parsing_config_variable_storage[key] = value
+    def __load_yaml(self, test_file, cache_directory):
+        if not cache_directory:
+            return self.__parse_yaml(test_file)
+
+        # Parsing the YAML file dominates the time it takes to load a test, while test files
+        # rarely change between two runs. The parsed document is cached on disk keyed by the test
+        # file path and invalidated whenever the file size or modification time changes.
+        # marshal is used since it is faster than pickle for builtin types and keeps strings
+        # interned.
+        stat = os.stat(test_file)
+        signature = (_CACHE_VERSION, yaml.__version__, SafeLoader.__name__,
+                     stat.st_mtime_ns, stat.st_size)
+        cache_key = hashlib.blake2b(os.path.abspath(
+            test_file).encode(), digest_size=16).hexdigest()
+        cache_file = os.path.join(cache_directory, cache_key + '.marshal')
+
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_signature, data = marshal.load(f)
+            if cached_signature == signature:
+                return data
+        except Exception:
+            # A missing, corrupted or incompatible cache entry is simply a cache miss.
+            pass
+
+        data = self.__parse_yaml(test_file)
+
+        temporary_file = None
+        try:
+            os.makedirs(cache_directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=cache_directory, delete=False) as f:
+                temporary_file = f.name
+                marshal.dump((signature, data), f)
+            os.replace(temporary_file, cache_file)
+            temporary_file = None
+        except (OSError, ValueError):
+            # Failing to write the cache should never prevent the test from running. ValueError
+            # is raised for documents using types that marshal does not support, e.g. timestamps.
+            pass
+        finally:
+            if temporary_file is not None:
+                with contextlib.suppress(OSError):
+                    os.unlink(temporary_file)
+
+        return data
 
-    def __load_yaml(self, test_file):
-        with open(test_file) as f:
-            loader = yaml.FullLoader
-            loader = fixes.try_add_yaml_support_for_scientific_notation_without_dot(
-                loader)
+    def __parse_yaml(self, test_file):
+        # The file is read as bytes in a single call: the YAML reader detects the encoding itself,
+        # and libyaml parses the whole buffer at once instead of pulling chunks from a Python
+        # stream.
+        with open(test_file, 'rb') as f:
+            content = f.read()
 
-            return yaml.load(f, Loader=loader)
-        return None
+        return yaml.load(content, Loader=_TestFileLoader)
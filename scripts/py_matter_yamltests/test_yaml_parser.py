@@ -20,11 +20,15 @@
 # is arguably better then no checks at all.
 
 import io
+import os
 import tempfile
 import unittest
+import unittest.mock
 
+from matter_yamltests.constraints import get_constraints
 from matter_yamltests.definitions import *
-from matter_yamltests.parser import TestParser, TestParserConfig
+from matter_yamltests.parser import (PostProcessCheckType, PostProcessResponseResult, TestParser, TestParserConfig,
+                                     _as_mapping, _TestFileLoader)
 
 simple_test_description = '''<?xml version="1.0"?>
   <configurator>
@@ -76,7 +80,7 @@ class TestYamlParser(unittest.TestCase):
             f.writelines(simple_test_yaml)
 
     def test_able_to_iterate_over_all_parsed_tests(self):
-        # self._yaml_parser.tests implements `__next__`, which does value substitution. We are
+        # self._yaml_parser.tests implements `__iter__`, which does value substitution. We are
         # simply ensure there is no exceptions raise.
         parser_config = TestParserConfig(None, self._definitions)
         yaml_parser = TestParser(self._temp_file.name, parser_config)
@@ -112,6 +116,210 @@ class TestYamlParser(unittest.TestCase):
         self.assertRaises(KeyError, TestParser,
                           self._temp_file.name, parser_config)
 
+    def test_cache_directory(self):
+        with tempfile.TemporaryDirectory() as cache_directory:
+            parser_config = TestParserConfig(
+                None, self._definitions, cache_directory=cache_directory)
+            yaml_parser = TestParser(self._temp_file.name, parser_config)
+            self.assertEqual(len(os.listdir(cache_directory)), 1)
+
+            with unittest.mock.patch.object(TestParser, '_TestParser__parse_yaml') as parse_yaml:
+                cached_yaml_parser = TestParser(
+                    self._temp_file.name, parser_config)
+            parse_yaml.assert_not_called()
+            self.assertEqual(cached_yaml_parser.name, yaml_parser.name)
+            self.assertEqual(cached_yaml_parser.tests.count,
+                             yaml_parser.tests.count)
+
+            with open(self._temp_file.name, 'a') as f:
+                f.write('''
+    - label: "Send Test Command Again"
+      command: "test"
+''')
+            updated_yaml_parser = TestParser(
+                self._temp_file.name, parser_config)
+            self.assertEqual(updated_yaml_parser.tests.count,
+                             yaml_parser.tests.count + 1)
+
+    def test_cache_directory_write_failure(self):
+        with tempfile.TemporaryDirectory() as cache_directory:
+            parser_config = TestParserConfig(
+                None, self._definitions, cache_directory=cache_directory)
+            with unittest.mock.patch('marshal.dump', side_effect=ValueError):
+                yaml_parser = TestParser(self._temp_file.name, parser_config)
+            self.assertEqual(yaml_parser.tests.count, 3)
+            self.assertEqual(os.listdir(cache_directory), [])
+
+    def test_shared_mappings_are_read_only(self):
+        mapping = _as_mapping(self._definitions, 'Test', 'TestStruct')
+        self.assertEqual(mapping, {'a': 'boolean'})
+        self.assertEqual(mapping.lowercased_keys, {'a': 'a'})
+        with self.assertRaises(TypeError):
+            mapping['a'] = 'int8u'
+        with self.assertRaises(TypeError):
+            mapping.update({'b': 'int8u'})
+        self.assertEqual(mapping, {'a': 'boolean'})
+
+    def test_loader_is_not_patched_on_every_load(self):
+        def count_resolvers():
+            return sum(len(resolvers) for resolvers in _TestFileLoader.yaml_implicit_resolvers.values())
+
+        parser_config = TestParserConfig(None, self._definitions)
+        TestParser(self._temp_file.name, parser_config)
+        resolvers_count = count_resolvers()
+        TestParser(self._temp_file.name, parser_config)
+        self.assertEqual(count_resolvers(), resolvers_count)
+
+    def test_config_variable_expression(self):
+        with open(self._temp_file.name, 'w') as f:
+            f.write('''
+name: Test Cluster Tests
+
+config:
+    nodeId: 0x12344321
+    cluster: "Test"
+    endpoint: 1
+    myValue:
+        type: int8u
+        defaultValue: 5
+
+tests:
+    - label: "Send Test Command With An Expression"
+      command: "test"
+      arguments:
+          values:
+              - name: "arg1"
+                value: "myValue + 1"
+              - name: "arg2"
+                value: "myValue * 2"
+''')
+        parser_config = TestParserConfig(None, self._definitions)
+        yaml_parser = TestParser(self._temp_file.name, parser_config)
+        test_step = next(iter(yaml_parser.tests))
+        values = test_step.arguments['values']
+        self.assertEqual(values[0]['value'], 6)
+        self.assertEqual(values[1]['value'], 10)
+
+    def test_config_variable_with_non_identifier_name(self):
+        with open(self._temp_file.name, 'w') as f:
+            f.write('''
+name: Test Cluster Tests
+
+config:
+    nodeId: 0x12344321
+    cluster: "Test"
+    endpoint: 1
+    my-var:
+        type: int8u
+        defaultValue: 7
+
+tests:
+    - label: "Send Test Command With A Non Identifier Variable"
+      command: "test"
+      arguments:
+          values:
+              - name: "arg1"
+                value: "my-var"
+              - name: "arg2"
+                value: "my-var + 1"
+''')
+        parser_config = TestParserConfig(None, self._definitions)
+        yaml_parser = TestParser(self._temp_file.name, parser_config)
+        test_step = next(iter(yaml_parser.tests))
+        values = test_step.arguments['values']
+        self.assertEqual(values[0]['value'], 7)
+        self.assertEqual(values[1]['value'], 8)
+
+    def test_constraints_with_variables(self):
+        with open(self._temp_file.name, 'w') as f:
+            f.write('''
+name: Test Cluster Tests
+
+config:
+    nodeId: 0x12344321
+    cluster: "Test"
+    endpoint: 1
+
+tests:
+    - label: "Save The Return Value"
+      command: "test"
+      response:
+          values:
+              - name: "returnValue"
+                saveAs: savedValue
+
+    - label: "Check The Return Value Against A Saved Variable"
+      command: "test"
+      response:
+          values:
+              - name: "returnValue"
+                constraints:
+                    maxValue: savedValue
+
+    - label: "Check The Return Value Against A Literal"
+      command: "test"
+      response:
+          values:
+              - name: "returnValue"
+                constraints:
+                    maxValue: 7
+''')
+        parser_config = TestParserConfig(None, self._definitions)
+        yaml_parser = TestParser(self._temp_file.name, parser_config)
+        # Test steps substitute variables when they are created, so they are created one by one
+        # as the test would run.
+        test_steps = iter(yaml_parser.tests)
+        result = next(test_steps).post_process_response(
+            {'value': {'returnValue': 7}})
+        self.assertTrue(result.is_success())
+        saved_value_step = next(test_steps)
+        literal_step = next(test_steps)
+
+        with unittest.mock.patch('matter_yamltests.parser.get_constraints', wraps=get_constraints) as parse_constraints:
+            # The substituted constraint is parsed again and used.
+            result = saved_value_step.post_process_response(
+                {'value': {'returnValue': 7}})
+            self.assertTrue(result.is_success())
+            result = saved_value_step.post_process_response(
+                {'value': {'returnValue': 8}})
+            self.assertTrue(result.is_failure())
+            self.assertEqual(parse_constraints.call_count, 2)
+
+            # Constraints without variables reuse the ones parsed with the test step.
+            parse_constraints.reset_mock()
+            result = literal_step.post_process_response(
+                {'value': {'returnValue': 8}})
+            self.assertTrue(result.is_failure())
+            parse_constraints.assert_not_called()
+
+
+class TestPostProcessResponseResult(unittest.TestCase):
+    def test_message_is_formatted_when_read(self):
+        result = PostProcessResponseResult()
+        message_args = {'name': 'value'}
+        result.success(PostProcessCheckType.RESPONSE_VALIDATION,
+                       'The test expectation "{name}" is valid.', message_args)
+
+        entry = result.entries[0]
+        message_args['name'] = 'otherValue'
+        self.assertEqual(
+            entry.message, 'The test expectation "otherValue" is valid.')
+
+        # Once formatted, the message does not depend on the arguments anymore.
+        message_args['name'] = 'yetAnotherValue'
+        self.assertEqual(
+            entry.message, 'The test expectation "otherValue" is valid.')
+
+    def test_message_without_arguments_is_not_formatted(self):
+        result = PostProcessResponseResult()
+        result.error(PostProcessCheckType.RESPONSE_VALIDATION,
+                     'The test expectation "{name}" is already formatted.')
+
+        entry = result.entries[0]
+        self.assertTrue(entry.is_error())
+        self.assertEqual(
+            entry.message, 'The test expectation "{name}" is already formatted.')
+
 
 def main():
     unittest.main()